@@ -0,0 +1,523 @@
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Protocol, Sequence, Tuple
+
+import chromadb
+import yaml
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from ingest_kb import (
+    VALID_LAYERS,
+    ENCODING_NAME,
+    ChunkConfig,
+    get_encoder,
+    load_documents,
+    load_env_file,
+    setup_logging,
+)
+from kb_shards import shard_collection_name, shard_metadata
+from retrieve_kb import (
+    build_filter,
+    rank_results,
+    resolve_collections,
+    resolve_layer,
+    search_collections,
+)
+
+
+LOGGER = logging.getLogger("kb_eval")
+VALID_BACKENDS = {"chroma", "sharded", "brute"}
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have",
+    "in", "is", "it", "of", "on", "or", "that", "the", "to", "was", "were", "i", "me", "my",
+}
+
+
+@dataclass(frozen=True)
+class RetrievalConfig:
+    backend: str
+    fetch_k: int
+    layer_bias: float
+    auto_summary: bool
+    dedupe: bool
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words embedder so the harness can run offline."""
+
+    def __init__(self, dim: int = 512) -> None:
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        tokens = [
+            token
+            for token in TOKEN_RE.findall(text.lower())
+            if token not in STOPWORDS and len(token) > 2
+        ]
+        features = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+        vector = [0.0] * self.dim
+        for feature in features:
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector))
+        if not norm:
+            return vector
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class SearchIndex(Protocol):
+    def search(
+        self, query_embedding: Sequence[float], fetch_k: int, filters: Dict
+    ) -> List[Tuple[Document, float]]:
+        ...
+
+
+def create_collection(
+    client: chromadb.ClientAPI,
+    name: str,
+    docs: List[Document],
+    vectors: List[List[float]],
+    metadata: Optional[Dict] = None,
+) -> None:
+    if name in {getattr(entry, "name", entry) for entry in client.list_collections()}:
+        client.delete_collection(name)
+    col = client.create_collection(name=name, metadata=metadata)
+    col.add(
+        ids=[str(idx) for idx in range(len(docs))],
+        embeddings=vectors,
+        documents=[doc.page_content for doc in docs],
+        metadatas=[doc.metadata for doc in docs],
+    )
+
+
+class BruteForceIndex:
+    """Exact squared-L2 scan over all vectors, the same metric Chroma uses by default."""
+
+    def __init__(self, docs: List[Document], vectors: List[List[float]]) -> None:
+        self.entries = list(zip(docs, vectors))
+
+    def search(
+        self, query_embedding: Sequence[float], fetch_k: int, filters: Dict
+    ) -> List[Tuple[Document, float]]:
+        hits: List[Tuple[Document, float]] = []
+        for doc, vector in self.entries:
+            metadata = doc.metadata or {}
+            if any(metadata.get(key) != value for key, value in filters.items()):
+                continue
+            distance = sum((a - b) ** 2 for a, b in zip(query_embedding, vector))
+            hits.append((doc, distance))
+        hits.sort(key=lambda hit: hit[1])
+        return hits[:fetch_k]
+
+
+class ChromaIndex:
+    """In-memory Chroma collection queried through retrieve_kb.search_collections."""
+
+    def __init__(
+        self,
+        client: chromadb.ClientAPI,
+        name: str,
+        docs: List[Document],
+        vectors: List[List[float]],
+    ) -> None:
+        create_collection(client, name, docs, vectors)
+        self.collections = resolve_collections(client, name, False, None)
+
+    def search(
+        self, query_embedding: Sequence[float], fetch_k: int, filters: Dict
+    ) -> List[Tuple[Document, float]]:
+        return search_collections(self.collections, query_embedding, fetch_k, filters, 1)
+
+
+class ShardedIndex:
+    """Per-topic in-memory shards queried through retrieve_kb's resolve and fan-out code."""
+
+    def __init__(
+        self,
+        client: chromadb.ClientAPI,
+        name: str,
+        docs: List[Document],
+        vectors: List[List[float]],
+        workers: int,
+    ) -> None:
+        shards: Dict[str, Tuple[List[Document], List[List[float]]]] = {}
+        for doc, vector in zip(docs, vectors):
+            shard_docs, shard_vectors = shards.setdefault(doc.metadata["topic"], ([], []))
+            shard_docs.append(doc)
+            shard_vectors.append(vector)
+        for topic, (shard_docs, shard_vectors) in shards.items():
+            create_collection(
+                client,
+                shard_collection_name(name, topic),
+                shard_docs,
+                shard_vectors,
+                metadata=shard_metadata(name, topic),
+            )
+        self.client = client
+        self.name = name
+        self.workers = workers
+        # Handles are resolved once per topic filter, as a long-lived service would.
+        self.handles: Dict[Optional[str], List[chromadb.Collection]] = {}
+
+    def search(
+        self, query_embedding: Sequence[float], fetch_k: int, filters: Dict
+    ) -> List[Tuple[Document, float]]:
+        topic = filters.get("topic")
+        if topic not in self.handles:
+            self.handles[topic] = resolve_collections(self.client, self.name, True, topic)
+        collections = self.handles[topic]
+        if not collections:
+            return []
+        return search_collections(collections, query_embedding, fetch_k, filters, self.workers)
+
+
+def load_golden(path: Path) -> List[Dict]:
+    data = yaml.safe_load(path.read_text(encoding="utf-8")) or []
+    if not isinstance(data, list):
+        raise SystemExit(f"Golden set must be a list of questions: {path}")
+    questions: List[Dict] = []
+    for idx, entry in enumerate(data, start=1):
+        if not isinstance(entry, dict) or not entry.get("question") or not entry.get("expected"):
+            raise SystemExit(f"Golden entry #{idx} needs 'question' and 'expected': {path}")
+        questions.append(entry)
+    if not questions:
+        raise SystemExit(f"Golden set has no questions: {path}")
+    return questions
+
+
+def matches(metadata: Dict, expected: Dict) -> bool:
+    if metadata.get("source_path") != expected["source_path"]:
+        return False
+    section_title = expected.get("section_title")
+    return section_title is None or metadata.get("section_title") == section_title
+
+
+def score_query(items: List[Dict], expected: List[Dict]) -> Tuple[float, float]:
+    found = sum(
+        1 for target in expected if any(matches(item["metadata"], target) for item in items)
+    )
+    reciprocal_rank = 0.0
+    for rank, item in enumerate(items, start=1):
+        if any(matches(item["metadata"], target) for target in expected):
+            reciprocal_rank = 1.0 / rank
+            break
+    return found / len(expected), reciprocal_rank
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def evaluate(
+    index: SearchIndex,
+    questions: List[Dict],
+    query_embeddings: List[List[float]],
+    cfg: RetrievalConfig,
+    top_k: int,
+) -> Dict:
+    recalls: List[float] = []
+    reciprocal_ranks: List[float] = []
+    latencies: List[float] = []
+    per_query: List[Dict] = []
+    for entry, query_embedding in zip(questions, query_embeddings):
+        question = entry["question"]
+        layer = resolve_layer(question, None, cfg.auto_summary)
+        filters = build_filter(entry.get("topic"), None, layer, None)
+        start = time.perf_counter()
+        results = index.search(query_embedding, max(cfg.fetch_k, top_k), filters)
+        items = rank_results(results, top_k, cfg.layer_bias, cfg.dedupe)
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        recall, reciprocal_rank = score_query(items, entry["expected"])
+        recalls.append(recall)
+        reciprocal_ranks.append(reciprocal_rank)
+        latencies.append(latency_ms)
+        per_query.append(
+            {
+                "question": question,
+                "recall": recall,
+                "reciprocal_rank": reciprocal_rank,
+                "latency_ms": latency_ms,
+                "hits": [
+                    {
+                        "source_path": item["metadata"].get("source_path"),
+                        "section_title": item["metadata"].get("section_title"),
+                        "layer": item["metadata"].get("layer"),
+                        "score": item["score"],
+                    }
+                    for item in items
+                ],
+            }
+        )
+    return {
+        "recall_at_k": statistics.fmean(recalls),
+        "mrr": statistics.fmean(reciprocal_ranks),
+        "latency_ms_mean": statistics.fmean(latencies),
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p95": percentile(latencies, 95),
+        "queries": per_query,
+    }
+
+
+def run_sweep(
+    kb_dir: Path,
+    questions: List[Dict],
+    embeddings: Embeddings,
+    chunk_cfgs: List[ChunkConfig],
+    retrieval_cfgs: List[RetrievalConfig],
+    top_k: int,
+    store_layers: set[str],
+    allow_file_fallback: bool,
+    allow_short_files: bool,
+    workers: int,
+) -> List[Dict]:
+    # Query vectors are computed once up front; latency covers search and ranking only.
+    query_embeddings = [embeddings.embed_query(entry["question"]) for entry in questions]
+    client = chromadb.EphemeralClient()
+    runs: List[Dict] = []
+    for chunk_cfg in chunk_cfgs:
+        docs = load_documents(
+            kb_dir, chunk_cfg, store_layers, allow_file_fallback, allow_short_files
+        )
+        if not docs:
+            LOGGER.warning("No documents for %s, skipping", chunk_cfg)
+            continue
+        vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+        suffix = f"{chunk_cfg.chunk_size}-{chunk_cfg.chunk_overlap}-{chunk_cfg.min_size}"
+        indexes: Dict[str, SearchIndex] = {}
+        for cfg in retrieval_cfgs:
+            if cfg.backend not in indexes:
+                if cfg.backend == "chroma":
+                    indexes[cfg.backend] = ChromaIndex(client, f"eval-{suffix}", docs, vectors)
+                elif cfg.backend == "sharded":
+                    indexes[cfg.backend] = ShardedIndex(
+                        client, f"eval-shard-{suffix}", docs, vectors, workers
+                    )
+                else:
+                    indexes[cfg.backend] = BruteForceIndex(docs, vectors)
+            LOGGER.debug("Evaluating %s with %s", chunk_cfg, cfg)
+            result = evaluate(indexes[cfg.backend], questions, query_embeddings, cfg, top_k)
+            runs.append(
+                {
+                    "chunk": asdict(chunk_cfg),
+                    "retrieval": asdict(cfg),
+                    "documents": len(docs),
+                    **result,
+                }
+            )
+    return runs
+
+
+def format_table(runs: List[Dict], top_k: int) -> str:
+    headers = [
+        "backend",
+        "chunk",
+        "docs",
+        "fetch_k",
+        "bias",
+        "auto_sum",
+        "dedupe",
+        f"recall@{top_k}",
+        "mrr",
+        "p50_ms",
+        "p95_ms",
+    ]
+    rows = [
+        [
+            run["retrieval"]["backend"],
+            "{chunk_size}/{chunk_overlap}/{min_size}".format(**run["chunk"]),
+            str(run["documents"]),
+            str(run["retrieval"]["fetch_k"]),
+            f"{run['retrieval']['layer_bias']:.2f}",
+            "on" if run["retrieval"]["auto_summary"] else "off",
+            "on" if run["retrieval"]["dedupe"] else "off",
+            f"{run['recall_at_k']:.3f}",
+            f"{run['mrr']:.3f}",
+            f"{run['latency_ms_p50']:.2f}",
+            f"{run['latency_ms_p95']:.2f}",
+        ]
+        for run in runs
+    ]
+    widths = [max(len(row[i]) for row in [headers] + rows) for i in range(len(headers))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in [headers] + rows]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def parse_list(raw: str, cast) -> List:
+    return [cast(value.strip()) for value in raw.split(",") if value.strip()]
+
+
+def parse_switch(raw: str) -> bool:
+    value = raw.lower()
+    if value in {"on", "true", "yes", "1"}:
+        return True
+    if value in {"off", "false", "no", "0"}:
+        return False
+    raise SystemExit(f"Invalid on/off value: {raw}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Evaluate recall and latency of kb retrieval",
+        epilog=(
+            f"Chunking uses tiktoken's {ENCODING_NAME} encoding. For fully offline runs it "
+            "must already be cached (run once online, or point TIKTOKEN_CACHE_DIR at a copy)."
+        ),
+    )
+    parser.add_argument("--kb-dir", default="kb", help="Path to kb directory")
+    parser.add_argument(
+        "--golden", default="scripts/golden_questions.yaml", help="Golden question set (YAML)"
+    )
+    parser.add_argument("--top-k", type=int, default=5, help="Cutoff for recall@k and MRR")
+    parser.add_argument("--fetch-k", default="15", help="Comma-separated fetch_k values")
+    parser.add_argument("--layer-bias", default="0.15", help="Comma-separated layer_bias values")
+    parser.add_argument("--auto-summary", default="off", help="Comma-separated on/off values")
+    parser.add_argument("--dedupe", default="on", help="Comma-separated on/off values")
+    parser.add_argument(
+        "--backends", default="chroma", help="Comma-separated: chroma,sharded,brute"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Threads for shard fan-out")
+    parser.add_argument("--chunk-size", default="500", help="Comma-separated chunk sizes")
+    parser.add_argument("--chunk-overlap", default="100", help="Comma-separated chunk overlaps")
+    parser.add_argument("--min-size", default="150", help="Comma-separated min sizes")
+    parser.add_argument(
+        "--store-layers",
+        default="summary,window,section",
+        help="Comma-separated layers to store: summary,window,section,file",
+    )
+    parser.add_argument(
+        "--allow-file-fallback",
+        action="store_true",
+        help="If a file yields no stored chunks, store its file-level doc as fallback.",
+    )
+    parser.add_argument(
+        "--allow-short-files",
+        action="store_true",
+        help="Allow file-level docs below min_size (useful for short notes).",
+    )
+    parser.add_argument(
+        "--embedder",
+        default="local",
+        choices=["local", "openai"],
+        help="local uses a deterministic hashing embedder and needs no API key or network.",
+    )
+    parser.add_argument("--local-dim", type=int, default=512, help="Local embedder dimension")
+    parser.add_argument("--json", action="store_true", help="Output JSON instead of a table")
+    parser.add_argument("--json-out", default=None, help="Write full results to this JSON file")
+    parser.add_argument("--env-file", default=".env", help="Path to .env file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    setup_logging(args.verbose)
+    if not args.verbose:
+        logging.getLogger("kb_ingest").setLevel(logging.WARNING)
+    load_env_file(Path(args.env_file))
+
+    try:
+        get_encoder()
+    except Exception as exc:
+        raise SystemExit(
+            f"Could not load tiktoken encoding {ENCODING_NAME}: {exc}. "
+            "Cache it first or set TIKTOKEN_CACHE_DIR."
+        ) from exc
+
+    if args.embedder == "openai":
+        if not os.getenv("OPENAI_API_KEY"):
+            raise SystemExit(
+                "OPENAI_API_KEY is not set. "
+                "Set it in your shell environment or .env file before running."
+            )
+        embeddings: Embeddings = OpenAIEmbeddings(
+            model=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+        )
+    else:
+        embeddings = HashingEmbeddings(dim=args.local_dim)
+
+    if not Path(args.kb_dir).exists():
+        raise SystemExit(f"kb_dir not found: {args.kb_dir}")
+    requested_layers = {layer.strip().lower() for layer in args.store_layers.split(",")}
+    if not requested_layers.issubset(VALID_LAYERS):
+        invalid = ", ".join(sorted(requested_layers - VALID_LAYERS))
+        raise SystemExit(f"Invalid layer(s): {invalid}. Valid: {', '.join(sorted(VALID_LAYERS))}")
+    backends = parse_list(args.backends, str.lower)
+    if not set(backends).issubset(VALID_BACKENDS):
+        invalid = ", ".join(sorted(set(backends) - VALID_BACKENDS))
+        raise SystemExit(f"Invalid backend(s): {invalid}. Valid: {', '.join(sorted(VALID_BACKENDS))}")
+
+    chunk_cfgs: List[ChunkConfig] = []
+    for size, overlap, min_size in itertools.product(
+        parse_list(args.chunk_size, int),
+        parse_list(args.chunk_overlap, int),
+        parse_list(args.min_size, int),
+    ):
+        if overlap >= size:
+            LOGGER.warning("Skipping chunk_size=%s chunk_overlap=%s: overlap >= size", size, overlap)
+            continue
+        chunk_cfgs.append(ChunkConfig(chunk_size=size, chunk_overlap=overlap, min_size=min_size))
+    if not chunk_cfgs:
+        raise SystemExit("No valid chunk configurations: chunk_overlap must be below chunk_size")
+    retrieval_cfgs = [
+        RetrievalConfig(*values)
+        for values in itertools.product(
+            backends,
+            parse_list(args.fetch_k, int),
+            parse_list(args.layer_bias, float),
+            parse_list(args.auto_summary, parse_switch),
+            parse_list(args.dedupe, parse_switch),
+        )
+    ]
+    questions = load_golden(Path(args.golden))
+    runs = run_sweep(
+        Path(args.kb_dir),
+        questions,
+        embeddings,
+        chunk_cfgs,
+        retrieval_cfgs,
+        args.top_k,
+        requested_layers,
+        args.allow_file_fallback,
+        args.allow_short_files,
+        args.workers,
+    )
+
+    payload = {
+        "embedder": args.embedder,
+        "top_k": args.top_k,
+        "questions": len(questions),
+        "runs": runs,
+    }
+    if args.json_out:
+        out_path = Path(args.json_out)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        LOGGER.info("Wrote %d runs to %s", len(runs), out_path)
+    if args.json:
+        print(json.dumps(payload, ensure_ascii=False, indent=2))
+        return
+    print(format_table(runs, args.top_k))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ from typing import Dict, List
 
 import chromadb
 
+from kb_shards import list_shards
+
 
 def strip_frontmatter(text: str) -> str:
     text = text.lstrip("\ufeff")
@@ -47,8 +49,31 @@ def load_env_file(path: Path) -> None:
         os.environ.setdefault(key, value)
 
 
-def export_vectors(persist_dir: Path, collection: str, out_path: Path) -> None:
+def collection_names(client: chromadb.ClientAPI, collection: str, sharded: bool) -> List[str]:
+    if not sharded:
+        return [collection]
+    shards = list_shards(client, collection)
+    return [shards[topic].name for topic in sorted(shards)]
+
+
+def export_vectors(persist_dir: Path, collection: str, out_path: Path, sharded: bool = False) -> None:
     client = chromadb.PersistentClient(path=str(persist_dir))
+    vectors: List[Dict] = []
+    for name in collection_names(client, collection, sharded):
+        vectors.extend(export_collection(client, name))
+
+    payload = {
+        "embedding_model": os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"),
+        "collection": collection,
+        "count": len(vectors),
+        "vectors": vectors,
+    }
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+    print(f"Exported {len(vectors)} vectors to {out_path}")
+
+
+def export_collection(client: chromadb.ClientAPI, collection: str) -> List[Dict]:
     col = client.get_or_create_collection(name=collection)
 
     data = col.get(include=["documents", "metadatas", "embeddings"])
@@ -77,16 +102,7 @@ def export_vectors(persist_dir: Path, collection: str, out_path: Path) -> None:
                 "embedding": emb,
             }
         )
-
-    payload = {
-        "embedding_model": os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"),
-        "collection": collection,
-        "count": len(vectors),
-        "vectors": vectors,
-    }
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
-    print(f"Exported {len(vectors)} vectors to {out_path}")
+    return vectors
 
 
 def main() -> None:
@@ -95,10 +111,15 @@ def main() -> None:
     parser.add_argument("--collection", default="kb_docs", help="Chroma collection")
     parser.add_argument("--out", default="db/kb_vectors.json", help="Output JSON path")
     parser.add_argument("--env-file", default=".env", help="Path to .env file")
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="Merge all per-topic shards (<collection>-<topic>) into one export.",
+    )
     args = parser.parse_args()
 
     load_env_file(Path(args.env_file))
-    export_vectors(Path(args.persist_dir), args.collection, Path(args.out))
+    export_vectors(Path(args.persist_dir), args.collection, Path(args.out), args.sharded)
 
 
 if __name__ == "__main__":
@@ -6,10 +6,12 @@ import os
 import shutil
 from dataclasses import dataclass
 from datetime import date, datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 import re
 
+import chromadb
 import tiktoken
 import yaml
 from langchain_core.documents import Document
@@ -17,12 +19,14 @@ from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import MarkdownHeaderTextSplitter, TokenTextSplitter
 from langchain_chroma import Chroma
 
+from kb_shards import list_shards, shard_collection_name, shard_metadata
+
 
 LOGGER = logging.getLogger("kb_ingest")
 ENCODING_NAME = "cl100k_base"
-ENCODER = tiktoken.get_encoding(ENCODING_NAME)
 VALID_LAYERS = {"summary", "window", "section", "file"}
 LAYER_RANK = {"summary": 0, "window": 1, "section": 2, "file": 3, "fallback": 4}
+COLLECTION_NAME_RE = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9._-]{1,510}[a-zA-Z0-9]$")
 
 
 @dataclass(frozen=True)
@@ -80,8 +84,27 @@ def iter_markdown_files(root: Path) -> Iterable[Path]:
             yield path
 
 
+def topic_for_path(kb_root: Path, file_path: Path) -> str:
+    rel_path = file_path.relative_to(kb_root)
+    return rel_path.parts[0] if len(rel_path.parts) > 1 else "kb"
+
+
+def validate_collection_name(collection: str) -> None:
+    if not COLLECTION_NAME_RE.match(collection):
+        raise SystemExit(
+            f"Invalid collection name: {collection}. "
+            "Use 3-512 chars [a-zA-Z0-9._-], starting and ending with alnum."
+        )
+
+
+@lru_cache(maxsize=1)
+def get_encoder() -> tiktoken.Encoding:
+    # Loaded on first use so importing this module never needs the network.
+    return tiktoken.get_encoding(ENCODING_NAME)
+
+
 def token_len(text: str) -> int:
-    return len(ENCODER.encode(text))
+    return len(get_encoder().encode(text))
 
 
 def normalize_text_for_hash(text: str) -> str:
@@ -148,7 +171,7 @@ def build_documents(
     docs: List[Document] = []
     seen_hashes: set[str] = set()
     rel_path = file_path.relative_to(kb_root)
-    topic = rel_path.parts[0] if len(rel_path.parts) > 1 else "kb"
+    topic = topic_for_path(kb_root, file_path)
     doc_type = frontmatter.get("doc_type") or topic
     is_summary = doc_type == "summary" or file_path.stem.lower() == "summary"
     base_meta = {
@@ -243,17 +266,58 @@ def build_documents(
     return docs
 
 
-def ingest(
-    kb_dir: Path,
+def write_collection(
+    docs: List[Document],
     persist_dir: Path,
     collection: str,
+    embeddings: OpenAIEmbeddings,
+    replace: bool,
+    collection_metadata: Optional[Dict] = None,
+) -> None:
+    vectordb = Chroma(
+        collection_name=collection,
+        embedding_function=embeddings,
+        persist_directory=str(persist_dir),
+        collection_metadata=collection_metadata,
+    )
+    if replace:
+        # Drop the previous contents so a shard can be rebuilt on its own.
+        vectordb.delete_collection()
+        vectordb = Chroma(
+            collection_name=collection,
+            embedding_function=embeddings,
+            persist_directory=str(persist_dir),
+            collection_metadata=collection_metadata,
+        )
+    vectordb.add_documents(docs)
+    persisted = False
+    if hasattr(vectordb, "persist"):
+        vectordb.persist()
+        persisted = True
+    elif hasattr(vectordb, "_client") and hasattr(vectordb._client, "persist"):
+        vectordb._client.persist()
+        persisted = True
+
+    if persisted:
+        LOGGER.info("Chroma collection %s persisted at %s", collection, persist_dir)
+    else:
+        LOGGER.info(
+            "Chroma persistence for %s handled automatically at %s", collection, persist_dir
+        )
+
+
+def load_documents(
+    kb_dir: Path,
     chunk_cfg: ChunkConfig,
     store_layers: set[str],
     allow_file_fallback: bool,
     allow_short_files: bool,
-) -> None:
+    topics: Optional[set[str]] = None,
+) -> List[Document]:
     all_docs: List[Document] = []
     paths = sorted(iter_markdown_files(kb_dir))
+    if topics:
+        paths = [path for path in paths if topic_for_path(kb_dir, path) in topics]
     total_files = len(paths)
     LOGGER.info("Processing %d markdown files", total_files)
     for idx, path in enumerate(paths, start=1):
@@ -281,35 +345,78 @@ def ingest(
         )
 
     LOGGER.info("Total documents: %d", len(all_docs))
-    if not all_docs:
+    return all_docs
+
+
+def prune_shards(persist_dir: Path, collection: str, keep_topics: set[str]) -> None:
+    # After a full sharded rebuild, drop shards for topics that no longer have
+    # documents so fan-out never reads stale data. Only collections stamped as
+    # shards of this collection are touched; the unsharded collection is left alone.
+    client = chromadb.PersistentClient(path=str(persist_dir))
+    for topic, col in list_shards(client, collection).items():
+        if topic in keep_topics:
+            continue
+        LOGGER.warning("Deleting stale shard %s", col.name)
+        client.delete_collection(col.name)
+
+
+def ingest(
+    kb_dir: Path,
+    persist_dir: Path,
+    collection: str,
+    chunk_cfg: ChunkConfig,
+    store_layers: set[str],
+    allow_file_fallback: bool,
+    allow_short_files: bool,
+    shard_by_topic: bool = False,
+    topics: Optional[set[str]] = None,
+) -> None:
+    all_docs = load_documents(
+        kb_dir,
+        chunk_cfg,
+        store_layers,
+        allow_file_fallback,
+        allow_short_files,
+        topics,
+    )
+    if not shard_by_topic:
+        if not all_docs:
+            LOGGER.warning("No documents found under %s", kb_dir)
+            return
+        embeddings = OpenAIEmbeddings(
+            model=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+        )
+        validate_collection_name(collection)
+        write_collection(all_docs, persist_dir, collection, embeddings, replace=False)
+        return
+
+    # One collection per top-level kb folder; each shard is replaced wholesale.
+    shards: Dict[str, List[Document]] = {}
+    for doc in all_docs:
+        shards.setdefault(doc.metadata["topic"], []).append(doc)
+    for topic in sorted(shards):
+        validate_collection_name(shard_collection_name(collection, topic))
+    if topics:
+        for topic in sorted(topics - set(shards)):
+            LOGGER.warning("No documents found for topic %s under %s", topic, kb_dir)
+    if not shards:
         LOGGER.warning("No documents found under %s", kb_dir)
         return
 
     embeddings = OpenAIEmbeddings(model=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"))
-    if not re.match(r"^[a-zA-Z0-9][a-zA-Z0-9._-]{1,510}[a-zA-Z0-9]$", collection):
-        raise SystemExit(
-            f"Invalid collection name: {collection}. "
-            "Use 3-512 chars [a-zA-Z0-9._-], starting and ending with alnum."
+    for topic in sorted(shards):
+        shard_name = shard_collection_name(collection, topic)
+        LOGGER.info("Rebuilding shard %s (%d docs)", shard_name, len(shards[topic]))
+        write_collection(
+            shards[topic],
+            persist_dir,
+            shard_name,
+            embeddings,
+            replace=True,
+            collection_metadata=shard_metadata(collection, topic),
         )
-
-    vectordb = Chroma(
-        collection_name=collection,
-        embedding_function=embeddings,
-        persist_directory=str(persist_dir),
-    )
-    vectordb.add_documents(all_docs)
-    persisted = False
-    if hasattr(vectordb, "persist"):
-        vectordb.persist()
-        persisted = True
-    elif hasattr(vectordb, "_client") and hasattr(vectordb._client, "persist"):
-        vectordb._client.persist()
-        persisted = True
-
-    if persisted:
-        LOGGER.info("Chroma persisted at %s", persist_dir)
-    else:
-        LOGGER.info("Chroma persistence handled automatically at %s", persist_dir)
+    if not topics:
+        prune_shards(persist_dir, collection, set(shards))
 
 
 def validate_chunk_config(chunk_cfg: ChunkConfig) -> None:
@@ -347,6 +454,16 @@ def main() -> None:
         action="store_true",
         help="Allow file-level docs below min_size (useful for short notes).",
     )
+    parser.add_argument(
+        "--shard-by-topic",
+        action="store_true",
+        help="Store one collection per topic, named <collection>-<topic>.",
+    )
+    parser.add_argument(
+        "--topics",
+        default=None,
+        help="Comma-separated topics to rebuild (requires --shard-by-topic).",
+    )
     parser.add_argument("--reset", action="store_true", help="Delete persist dir")
     parser.add_argument("--verbose", action="store_true")
     args = parser.parse_args()
@@ -354,6 +471,8 @@ def main() -> None:
     setup_logging(args.verbose)
     load_env_file(Path(args.env_file))
 
+    if args.reset and args.topics:
+        raise SystemExit("--reset cannot be combined with --topics; it would delete every shard")
     if args.reset and Path(args.persist_dir).exists():
         LOGGER.warning("Resetting %s", args.persist_dir)
         shutil.rmtree(args.persist_dir)
@@ -376,6 +495,11 @@ def main() -> None:
     if not requested_layers.issubset(VALID_LAYERS):
         invalid = ", ".join(sorted(requested_layers - VALID_LAYERS))
         raise SystemExit(f"Invalid layer(s): {invalid}. Valid: {', '.join(sorted(VALID_LAYERS))}")
+    topics = None
+    if args.topics:
+        if not args.shard_by_topic:
+            raise SystemExit("--topics requires --shard-by-topic")
+        topics = {topic.strip() for topic in args.topics.split(",") if topic.strip()}
     ingest(
         Path(args.kb_dir),
         Path(args.persist_dir),
@@ -384,6 +508,8 @@ def main() -> None:
         requested_layers,
         args.allow_file_fallback,
         args.allow_short_files,
+        shard_by_topic=args.shard_by_topic,
+        topics=topics,
     )
 
 
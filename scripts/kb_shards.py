@@ -0,0 +1,29 @@
+from typing import Dict
+
+import chromadb
+
+
+SHARD_SEPARATOR = "-"
+SHARD_OF_KEY = "shard_of"
+SHARD_TOPIC_KEY = "topic"
+
+
+def shard_collection_name(collection: str, topic: str) -> str:
+    return f"{collection}{SHARD_SEPARATOR}{topic}"
+
+
+def shard_metadata(collection: str, topic: str) -> Dict:
+    return {SHARD_OF_KEY: collection, SHARD_TOPIC_KEY: topic}
+
+
+def list_shards(client: chromadb.ClientAPI, collection: str) -> Dict[str, chromadb.Collection]:
+    # Shards are identified by the metadata stamped at creation, not by name, so an
+    # unrelated collection such as kb_docs-v2 is never mistaken for a shard.
+    shards: Dict[str, chromadb.Collection] = {}
+    for entry in client.list_collections():
+        # Older chromadb returns plain names, newer returns Collection objects.
+        col = entry if hasattr(entry, "metadata") else client.get_collection(entry)
+        metadata = col.metadata or {}
+        if metadata.get(SHARD_OF_KEY) == collection and metadata.get(SHARD_TOPIC_KEY):
+            shards[metadata[SHARD_TOPIC_KEY]] = col
+    return shards
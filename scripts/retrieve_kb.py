@@ -2,12 +2,16 @@ import argparse
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from langchain_chroma import Chroma
+import chromadb
+from langchain_core.documents import Document
 from langchain_openai import OpenAIEmbeddings
 
+from kb_shards import list_shards
+
 
 LOGGER = logging.getLogger("kb_retrieve")
 SUMMARY_TRIGGERS = (
@@ -57,6 +61,15 @@ def build_filter(
     return filters
 
 
+def to_chroma_where(filters: Dict) -> Optional[Dict]:
+    # Chroma only accepts a single field per where clause; combine the rest with $and.
+    if not filters:
+        return None
+    if len(filters) == 1:
+        return dict(filters)
+    return {"$and": [{key: value} for key, value in filters.items()]}
+
+
 def strip_frontmatter(text: str) -> str:
     text = text.lstrip("\ufeff")
     if not text.startswith("---"):
@@ -77,35 +90,45 @@ def is_summary_intent(query: str) -> bool:
     return any(trigger in q for trigger in SUMMARY_TRIGGERS)
 
 
+def resolve_layer(query: str, layer: Optional[str], auto_summary: bool) -> Optional[str]:
+    if auto_summary and not layer and is_summary_intent(query):
+        return "summary"
+    return layer
+
+
 def normalize_score(distance: float, layer_rank: int, layer_bias: float) -> float:
     if layer_bias <= 0:
         return distance
     return distance + (layer_bias * (layer_rank / 10.0))
 
 
-def retrieve(
-    query: str,
-    persist_dir: Path,
-    collection: str,
-    top_k: int,
+def search_collection(
+    col: chromadb.Collection,
+    query_embedding: Sequence[float],
     fetch_k: int,
-    layer_bias: float,
     filters: Dict,
-    dedupe: bool,
-) -> List[Dict]:
-    embeddings = OpenAIEmbeddings(model=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"))
-    vectordb = Chroma(
-        collection_name=collection,
-        embedding_function=embeddings,
-        persist_directory=str(persist_dir),
+) -> List[Tuple[Document, float]]:
+    response = col.query(
+        query_embeddings=[list(query_embedding)],
+        n_results=fetch_k,
+        where=to_chroma_where(filters),
+        include=["documents", "metadatas", "distances"],
     )
+    documents = (response.get("documents") or [[]])[0]
+    metadatas = (response.get("metadatas") or [[]])[0]
+    distances = (response.get("distances") or [[]])[0]
+    return [
+        (Document(page_content=text or "", metadata=metadata or {}), distance)
+        for text, metadata, distance in zip(documents, metadatas, distances)
+    ]
 
-    results = vectordb.similarity_search_with_score(
-        query,
-        k=fetch_k,
-        filter=filters or None,
-    )
 
+def rank_results(
+    results: List[Tuple[Document, float]],
+    top_k: int,
+    layer_bias: float,
+    dedupe: bool,
+) -> List[Dict]:
     scored: List[Dict] = []
     seen_hashes: set[str] = set()
     for doc, distance in results:
@@ -132,6 +155,67 @@ def retrieve(
     return scored[:top_k]
 
 
+def resolve_collections(
+    client: chromadb.ClientAPI,
+    collection: str,
+    sharded: bool,
+    topic: Optional[str],
+) -> List[chromadb.Collection]:
+    if not sharded:
+        return [client.get_collection(collection)]
+    shards = list_shards(client, collection)
+    if topic:
+        if topic not in shards:
+            LOGGER.warning("No shard for topic %s under %s", topic, collection)
+            return []
+        return [shards[topic]]
+    return [shards[name] for name in sorted(shards)]
+
+
+def search_collections(
+    collections: List[chromadb.Collection],
+    query_embedding: Sequence[float],
+    fetch_k: int,
+    filters: Dict,
+    workers: int,
+) -> List[Tuple[Document, float]]:
+    if len(collections) == 1:
+        return search_collection(collections[0], query_embedding, fetch_k, filters)
+    LOGGER.debug("Fanning out over %d shards", len(collections))
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(collections)))) as pool:
+        per_shard = pool.map(
+            lambda col: search_collection(col, query_embedding, fetch_k, filters),
+            collections,
+        )
+        results = [hit for hits in per_shard for hit in hits]
+    results.sort(key=lambda hit: hit[1])
+    return results
+
+
+def retrieve(
+    query: str,
+    persist_dir: Path,
+    collection: str,
+    top_k: int,
+    fetch_k: int,
+    layer_bias: float,
+    filters: Dict,
+    dedupe: bool,
+    sharded: bool = False,
+    workers: int = 4,
+) -> List[Dict]:
+    embeddings = OpenAIEmbeddings(model=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"))
+    client = chromadb.PersistentClient(path=str(persist_dir))
+    collections = resolve_collections(client, collection, sharded, filters.get("topic"))
+    if not collections:
+        return []
+
+    # Embed once and reuse the vector for every shard.
+    query_embedding = embeddings.embed_query(query)
+    results = search_collections(collections, query_embedding, fetch_k, filters, workers)
+    return rank_results(results, top_k, layer_bias, dedupe)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Retrieve from Chroma KB")
     parser.add_argument("--query", required=True, help="Search query")
@@ -145,6 +229,12 @@ def main() -> None:
     parser.add_argument("--layer", default=None, help="Filter by layer (summary, window, section)")
     parser.add_argument("--retrieval-tier", default=None, help="Filter by retrieval_tier")
     parser.add_argument("--env-file", default=".env", help="Path to .env file")
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="Query per-topic shards (<collection>-<topic>) built with --shard-by-topic.",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Threads for shard fan-out")
     parser.add_argument("--no-dedupe", action="store_true", help="Disable content_hash dedupe")
     parser.add_argument(
         "--auto-summary",
@@ -164,9 +254,7 @@ def main() -> None:
             "Set it in your shell environment or .env file before running."
         )
 
-    layer = args.layer
-    if args.auto_summary and not layer and is_summary_intent(args.query):
-        layer = "summary"
+    layer = resolve_layer(args.query, args.layer, args.auto_summary)
     filters = build_filter(args.topic, args.doc_type, layer, args.retrieval_tier)
     items = retrieve(
         query=args.query,
@@ -177,6 +265,8 @@ def main() -> None:
         layer_bias=args.layer_bias,
         filters=filters,
         dedupe=not args.no_dedupe,
+        sharded=args.sharded,
+        workers=args.workers,
     )
 
     if args.json: